@@ -4,6 +4,8 @@ import os
 import gc # Thư viện quản lý bộ nhớ (Garbage Collector)
 import glob # Để tìm kiếm files tự động
 import time # Để đo thời gian xử lý
+from gps_archive import write_archive_from_csv, archive_path_for
+from data_train import STOP_RADIUS_DEG # Dùng chung ô nhận diện trạm với data_train.find_stop_visits
 
 # --- 1. HÀM TÍNH KHOẢNG CÁCH HAVERSINE (meters) ---
 def haversine_np(lon1, lat1, lon2, lat2):
@@ -101,13 +103,136 @@ def process_one_file(file_path, output_dir):
     return row_count
 
 # =========================================================================
-# PHA 2: NÉN DỮ LIỆU TĨNH VÀ LƯU ĐÈ (Compress and Overwrite)
+# PHA 2: NÉN QUỸ ĐẠO CÓ KIỂM SOÁT SAI SỐ VÀ LƯU ĐÈ (Compress and Overwrite)
 # =========================================================================
 
-def compress_and_overwrite(file_path):
+# --- CẤU HÌNH NÉN ---
+SIMPLIFY_TOLERANCE_M = 10.0 # Sai số vị trí tối đa (mét) cho điểm bị bỏ
+EARTH_RADIUS_M = 6367000.0  # Cùng bán kính với haversine_np
+
+def load_stop_coords(route_dir):
+    """
+    Gom tọa độ (Lng, Lat) của mọi trạm (chiều đi + chiều về) trong thư mục tuyến.
+    Trả về mảng (n, 2); thư mục không tồn tại -> mảng rỗng.
+    """
+    coords = []
+    if route_dir and os.path.isdir(route_dir):
+        for folder in [f.path for f in os.scandir(route_dir) if f.is_dir()]:
+            for f_name in ['stops_by_var.csv', 'rev_stops_by_var.csv']:
+                f_path = os.path.join(folder, f_name)
+                if os.path.exists(f_path):
+                    df = pd.read_csv(f_path)
+                    if 'Lng' in df.columns and 'Lat' in df.columns:
+                        coords.append(df[['Lng', 'Lat']].dropna().to_numpy(dtype=np.float64))
+    if not coords:
+        return np.empty((0, 2))
+    return np.unique(np.concatenate(coords), axis=0)
+
+def near_stop_mask(lng, lat, stop_coords, radius_deg=STOP_RADIUS_DEG):
     """
-    PHA 2: Đọc file _final_clean, áp dụng nén tĩnh (theo tọa độ và trạng thái cửa), 
-    và lưu đè lên chính file đó để rút gọn data.
+    Đánh dấu các điểm mà data_train.find_stop_visits cần để tính giờ tới/rời trạm:
+    điểm đầu và điểm cuối của mỗi chuỗi điểm liên tiếp trong ô ±radius_deg quanh cùng một trạm
+    (đúng ô nhận diện trạm), cùng điểm ngay trước và ngay sau chuỗi đó.
+    Điểm nằm giữa chuỗi để Douglas-Peucker quyết định (điểm đổi trạng thái cửa đã là anchor riêng).
+    Mỗi điểm chỉ được so với các trạm thuộc 9 ô lưới (cạnh radius_deg) xung quanh nó.
+    """
+    mask = np.zeros(len(lng), dtype=bool)
+    if len(stop_coords) == 0 or len(lng) == 0:
+        return mask
+
+    def cell_of(x_lng, y_lat):
+        cx = np.floor(x_lng / radius_deg).astype(np.int64)
+        cy = np.floor(y_lat / radius_deg).astype(np.int64)
+        return cx * 100_000_000 + cy
+
+    # Tra ô -> trạm: sắp trạm theo mã ô, mỗi ô là một khoảng liên tiếp [lo, hi)
+    stop_cells = cell_of(stop_coords[:, 0], stop_coords[:, 1])
+    stop_order = np.argsort(stop_cells, kind='stable')
+    sorted_cells = stop_cells[stop_order]
+
+    valid = ~(np.isnan(lng) | np.isnan(lat))
+    candidates = np.flatnonzero(valid)
+    candidate_cells = cell_of(lng[candidates], lat[candidates])
+
+    # Ghép (điểm, trạm) với các trạm trong ô của điểm + 8 ô xung quanh, rồi so chính xác
+    point_parts, stop_parts = [], []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            cells = candidate_cells + dx * 100_000_000 + dy
+            lo = np.searchsorted(sorted_cells, cells, side='left')
+            count = np.searchsorted(sorted_cells, cells, side='right') - lo
+            has = count > 0
+            if not has.any():
+                continue
+            count = count[has]
+            points = np.repeat(candidates[has], count)
+            within = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+            stops = stop_order[np.repeat(lo[has], count) + within]
+            in_box = ((np.abs(lng[points] - stop_coords[stops, 0]) < radius_deg) &
+                      (np.abs(lat[points] - stop_coords[stops, 1]) < radius_deg))
+            point_parts.append(points[in_box])
+            stop_parts.append(stops[in_box])
+    if not point_parts:
+        return mask
+    points = np.concatenate(point_parts)
+    stops = np.concatenate(stop_parts)
+
+    # Điểm biên của chuỗi: điểm trước hoặc điểm sau không nằm trong ô của cùng trạm
+    n_stops = len(stop_coords)
+    pair_keys = np.sort(points * n_stops + stops)
+    prev_in = np.isin((points - 1) * n_stops + stops, pair_keys, assume_unique=False)
+    next_in = np.isin((points + 1) * n_stops + stops, pair_keys, assume_unique=False)
+    run_start = points[~prev_in]
+    run_end = points[~next_in]
+
+    # Giữ thêm điểm ngay ngoài chuỗi (điểm kề thuộc xe khác đã là anchor đầu/cuối xe nên không ảnh hưởng)
+    mask[run_start] = True
+    mask[run_end] = True
+    mask[run_start[run_start > 0] - 1] = True
+    mask[run_end[run_end < len(lng) - 1] + 1] = True
+    return mask
+
+def simplify_trajectory_mask(x, y, t, anchors, tolerance_m=SIMPLIFY_TOLERANCE_M):
+    """
+    Douglas-Peucker theo thời gian (khoảng cách đồng bộ thời gian - SED):
+    vị trí của điểm bị bỏ được nội suy tuyến tính theo thời gian giữa 2 điểm giữ lại,
+    nên cả quỹ đạo lẫn thời điểm xe qua trạm đều sai lệch không quá tolerance_m.
+    x, y: tọa độ phẳng (mét); t: thời gian (giây); anchors: mask các điểm bắt buộc giữ
+    (đầu/cuối mỗi xe, đổi trạng thái cửa, gần trạm...). Đoạn không bao giờ vượt qua anchor.
+    Trả về (mask giữ lại, sai số lớn nhất của các điểm bị bỏ).
+    """
+    keep = anchors.copy()
+    anchor_idx = np.flatnonzero(anchors)
+    max_error = 0.0
+
+    # Chỉ xử lý các đoạn giữa 2 anchor liên tiếp có điểm ở giữa
+    gaps = np.flatnonzero(np.diff(anchor_idx) > 1)
+    stack = list(zip(anchor_idx[gaps], anchor_idx[gaps + 1]))
+
+    while stack:
+        a, b = stack.pop()
+        dt = t[b] - t[a]
+        ratio = (t[a + 1:b] - t[a]) / dt if dt > 0 else np.zeros(b - a - 1)
+        err = np.hypot(x[a + 1:b] - (x[a] + ratio * (x[b] - x[a])),
+                       y[a + 1:b] - (y[a] + ratio * (y[b] - y[a])))
+        m = int(np.argmax(err))
+        if err[m] > tolerance_m:
+            m += a + 1
+            keep[m] = True
+            if m - a > 1:
+                stack.append((a, m))
+            if b - m > 1:
+                stack.append((m, b))
+        else:
+            max_error = max(max_error, float(err[m]))
+
+    return keep, max_error
+
+def compress_and_overwrite(file_path, stop_coords=None, tolerance_m=SIMPLIFY_TOLERANCE_M):
+    """
+    PHA 2: Đọc file _final_clean, nén quỹ đạo từng xe với sai số vị trí tối đa tolerance_m (mét),
+    luôn giữ điểm đổi trạng thái cửa và điểm biên ô trạm, rồi lưu đè lên chính file đó.
+    Trả về dict thống kê (số dòng trước/sau, tỷ lệ nén, sai số lớn nhất) hoặc None nếu lỗi.
     """
     file_name = os.path.basename(file_path)
     
@@ -117,39 +242,57 @@ def compress_and_overwrite(file_path):
         df['datetime'] = pd.to_datetime(df['datetime'])
     except Exception as e:
         print(f"    ❌ Lỗi đọc file {file_name}: {e}")
-        return 
-
-    # --- BƯỚC NÉN DỮ LIỆU TĨNH ---
-    # 1. Tạo chữ ký nén (Bao gồm tọa độ và trạng thái cửa)
-    df['compression_signature'] = (
-        df['lng'].round(5).astype(str) + '_' + 
-        df['lat'].round(5).astype(str) + '_' +
-        df['door_up'].astype(str) + '_' + 
-        df['door_down'].astype(str)
-    )
-    
-    # 2. Xác định bản ghi cần giữ
-    mask_start_of_vehicle = df['anonymized_vehicle'].shift(1) != df['anonymized_vehicle']
-    mask_change = (
-        df.groupby('anonymized_vehicle')['compression_signature'].shift(1) != df['compression_signature']
-    )
-    mask_keep = mask_change | mask_start_of_vehicle
-    
-    # 3. Áp dụng mask nén
+        return None
+
     initial_rows = len(df)
-    df = df[mask_keep].copy()
-    
-    # Xóa cột phụ và reset index
-    df.drop(columns=['compression_signature'], inplace=True)
-    df.reset_index(drop=True, inplace=True)
-    
+    if initial_rows == 0:
+        return None
+
+    # File từ PHA 1 đã sắp theo (xe, thời gian) -> mỗi xe là một khối liên tiếp
+    lng = df['lng'].to_numpy(dtype=np.float64)
+    lat = df['lat'].to_numpy(dtype=np.float64)
+    t = (df['datetime'] - df['datetime'].iloc[0]).dt.total_seconds().to_numpy()
+
+    # 1. Chiếu sang mặt phẳng (mét) quanh vĩ độ trung bình của file
+    lat0 = np.radians(np.nanmean(lat))
+    x = np.radians(lng) * np.cos(lat0) * EARTH_RADIUS_M
+    y = np.radians(lat) * EARTH_RADIUS_M
+
+    # 2. Các điểm bắt buộc giữ
+    vehicle = df['anonymized_vehicle']
+    mask_start_of_vehicle = (vehicle.shift(1) != vehicle).to_numpy()
+    mask_end_of_vehicle = (vehicle.shift(-1) != vehicle).to_numpy()
+
+    door_state = df['door_up'].astype(str) + '_' + df['door_down'].astype(str)
+    door_change = (door_state.shift(1) != door_state).to_numpy() & ~mask_start_of_vehicle
+    # Giữ cả điểm ngay trước khi đổi để khoảng mở/đóng cửa không bị kéo dài
+    mask_door = door_change | np.append(door_change[1:], False)
+
+    mask_near_stop = near_stop_mask(lng, lat, stop_coords if stop_coords is not None else np.empty((0, 2)))
+    mask_invalid = np.isnan(x) | np.isnan(y) | np.isnan(t)
+
+    anchors = mask_start_of_vehicle | mask_end_of_vehicle | mask_door | mask_near_stop | mask_invalid
+
+    # 3. Nén phần quỹ đạo còn lại giữa các anchor
+    mask_keep, max_error = simplify_trajectory_mask(x, y, t, anchors, tolerance_m)
+    df = df[mask_keep].reset_index(drop=True)
+
     # 4. Lưu đè lên file gốc
     df.to_csv(file_path, index=False)
 
-    print(f"    ✅ PHA 2 Xong! Đã nén và lưu đè. Giảm từ {initial_rows} bản ghi xuống còn {len(df)} bản ghi.")
+    stats = {
+        'file': file_name,
+        'rows_before': initial_rows,
+        'rows_after': len(df),
+        'compression_ratio': initial_rows / max(len(df), 1),
+        'max_error_m': max_error,
+    }
+    print(f"    ✅ PHA 2 Xong! Đã nén và lưu đè. Giảm từ {initial_rows} bản ghi xuống còn {len(df)} bản ghi "
+          f"(tỷ lệ nén {stats['compression_ratio']:.2f}x, sai số lớn nhất {max_error:.2f} m).")
     
     del df
     gc.collect()
+    return stats
 
 # =========================================================================
 # CHƯƠNG TRÌNH CHÍNH (ĐIỀU PHỐI HAI PHA XỬ LÝ)
@@ -159,6 +302,8 @@ def main_full_process():
     
     # !!! CẬP NHẬT ĐƯỜNG DẪN NÀY ĐỂ TRỎ ĐÚNG ĐẾN THƯ MỤC 'raw_GPS' CỦA BẠN !!!
     RAW_GPS_FOLDER = r"D:\HCMUT-workplace\BDC_Hackathon\raw_GPS"
+    # Thư mục tuyến (để giữ nguyên các điểm gần trạm khi nén). Không có -> chỉ giữ điểm đổi trạng thái cửa.
+    ROUTE_DIR = r"D:\HCMUT-workplace\BDC_Hackathon\HCMC_bus_routes"
     
     if not os.path.isdir(RAW_GPS_FOLDER):
         print(f"❌ LỖI: Không tìm thấy thư mục GPS tại đường dẫn: {RAW_GPS_FOLDER}")
@@ -183,9 +328,9 @@ def main_full_process():
     end_time_1 = time.time()
     print(f"\n🎉 HOÀN THÀNH PHA 1. Tổng thời gian: {end_time_1 - start_time_1:.2f} giây.")
 
-    # --- PHA 2: NÉN DỮ LIỆU TĨNH VÀ LƯU ĐÈ ---
+    # --- PHA 2: NÉN QUỸ ĐẠO VÀ LƯU ĐÈ ---
     print("\n" + "="*80)
-    print("PHA 2: BẮT ĐẦU NÉN DỮ LIỆU TĨNH (RÚT GỌN FILES ĐÃ LÀM SẠCH)")
+    print("PHA 2: BẮT ĐẦU NÉN QUỸ ĐẠO (RÚT GỌN FILES ĐÃ LÀM SẠCH)")
     print("="*80)
 
     start_time_2 = time.time()
@@ -196,15 +341,37 @@ def main_full_process():
         print(f"⚠️ Không tìm thấy file 'final_clean' nào để nén. Đã dừng lại.")
         return
     
+    stop_coords = load_stop_coords(ROUTE_DIR)
+    print(f"Sai số cho phép: {SIMPLIFY_TOLERANCE_M} m - Giữ điểm trong ô ±{STOP_RADIUS_DEG}° quanh {len(stop_coords)} trạm.")
+
+    compression_stats = []
     for file_path in all_clean_files:
-        compress_and_overwrite(file_path)
+        stats = compress_and_overwrite(file_path, stop_coords)
+        if stats:
+            compression_stats.append(stats)
+
+    if compression_stats:
+        print("\nBÁO CÁO NÉN THEO FILE:")
+        print(pd.DataFrame(compression_stats).to_string(index=False))
 
     end_time_2 = time.time()
 
+    # --- PHA 3: GHI ARCHIVE NHỊ PHÂN (MEMMAP + CHỈ MỤC THEO XE) ---
+    print("\n" + "="*80)
+    print("PHA 3: GHI ARCHIVE NHỊ PHÂN ĐỂ TRUY CẬP NHANH THEO XE")
+    print("="*80)
+
+    start_time_3 = time.time()
+    for file_path in all_clean_files:
+        n_rows = write_archive_from_csv(file_path)
+        print(f"    ✅ PHA 3 Xong! {os.path.basename(archive_path_for(file_path))}.bin ({n_rows} bản ghi)")
+    end_time_3 = time.time()
+
     print("\n" + "="*80)
     print(f"🎉 HOÀN TẤT TOÀN BỘ XỬ LÝ! Đã xử lý {len(all_clean_files)} files.")
     print(f"Tổng thời gian PHA 1: {end_time_1 - start_time_1:.2f} giây.")
     print(f"Tổng thời gian PHA 2: {end_time_2 - start_time_2:.2f} giây.")
+    print(f"Tổng thời gian PHA 3: {end_time_3 - start_time_3:.2f} giây.")
     print("="*80)
     print("Dữ liệu đã được làm sạch và rút gọn tối đa, sẵn sàng cho phân tích Insight.")
 
@@ -3,6 +3,7 @@ import numpy as np
 import os
 import glob
 from datetime import timedelta
+from gps_archive import open_archive_for
 
 # --- CẤU HÌNH ---
 # Đường dẫn chứa file GPS raw
@@ -11,6 +12,60 @@ GPS_FOLDER = r"D:\HCMUT-workplace\BDC_Hackathon\processed_GPS"
 MAPPING_FILE = r"D:\HCMUT-workplace\BDC_Hackathon\Master_Vehicle_Route_Mapping.csv" 
 # Đường dẫn file trạm dừng Tuyến 01 
 STOPS_FILE = r"D:\HCMUT-workplace\BDC_Hackathon\HCMC_bus_routes\88\stops_by_var.csv"
+# File sự kiện xe ghé trạm (đầu vào cho stop_analytics.py)
+STOP_EVENTS_FILE = "Stop_Events.csv"
+
+STOP_RADIUS_DEG = 0.001     # 0.001 độ ~ 100m: điểm GPS trong ô này coi như đang ở trạm
+STOP_VISIT_GAP_SEC = 120    # Hai cụm điểm gần trạm cách nhau ít hơn -> vẫn là 1 lần ghé (nhiễu GPS)
+
+def find_stop_visits(trip_data, stops_coords):
+    """
+    Tìm MỌI lần 1 xe ghé từng trạm trong ngày (trip_data đã sắp theo thời gian).
+    Mỗi lần ghé = chuỗi điểm GPS liên tiếp nằm gần trạm:
+    Arrival = điểm đầu tiên, Departure = điểm cuối cùng, Door_Open = có mở cửa trong lúc ghé.
+    Dwell_Seconds = từ điểm đầu tiên mở cửa tới điểm đầu tiên cửa đóng lại sau lần mở cuối
+    (NaN nếu xe chạy qua không mở cửa); In_Stop_Seconds = thời gian xe nằm trong ô trạm.
+    """
+    times = trip_data['datetime'].reset_index(drop=True)
+    lat = trip_data['lat'].to_numpy()
+    lng = trip_data['lng'].to_numpy()
+    door = np.zeros(len(trip_data), dtype=bool)
+    for col in ['door_up', 'door_down']:
+        if col in trip_data.columns:
+            door |= trip_data[col].fillna(0).to_numpy().astype(bool)
+    seconds = (times - times.iloc[0]).dt.total_seconds().to_numpy() if len(times) else np.empty(0)
+
+    visits = []
+    for i, stop in enumerate(stops_coords):
+        # Tính khoảng cách (Manhattan distance cho nhanh)
+        mask = (np.abs(lat - stop['Lat']) < STOP_RADIUS_DEG) & (np.abs(lng - stop['Lng']) < STOP_RADIUS_DEG)
+        idx = np.flatnonzero(mask)
+        if len(idx) == 0:
+            continue
+
+        # Tách lần ghé khi chuỗi điểm bị ngắt và cách nhau đủ lâu
+        breaks = np.flatnonzero((np.diff(idx) > 1) & (np.diff(seconds[idx]) > STOP_VISIT_GAP_SEC)) + 1
+        for run in np.split(idx, breaks):
+            arrival = times.iloc[run[0]]
+            departure = times.iloc[run[-1]]
+
+            # Khoảng mở cửa: điểm đóng cửa có thể nằm ngay sau chuỗi điểm trong ô trạm
+            open_rows = run[door[run]]
+            dwell = np.nan
+            if len(open_rows):
+                close_row = min(open_rows[-1] + 1, len(times) - 1)
+                dwell = (times.iloc[close_row] - times.iloc[open_rows[0]]).total_seconds()
+
+            visits.append({
+                'Stop_Index': i,
+                'StopId': stop['StopId'],
+                'Arrival': arrival,
+                'Departure': departure,
+                'Dwell_Seconds': dwell,
+                'In_Stop_Seconds': (departure - arrival).total_seconds(),
+                'Door_Open': len(open_rows) > 0
+            })
+    return visits
 
 def create_travel_time_dataset():
     # 1. Load dữ liệu
@@ -19,7 +74,8 @@ def create_travel_time_dataset():
         print(f"LỖI: Chưa có file {MAPPING_FILE}. Hãy chạy code Map Matching ở bước trước!")
         return
     
-    df_mapping = pd.read_csv(MAPPING_FILE)
+    # Mã xe luôn đọc dạng chuỗi để khớp với archive nhị phân
+    df_mapping = pd.read_csv(MAPPING_FILE, dtype={'Vehicle_ID': str})
     
     # Lọc chỉ lấy các xe chạy Tuyến 01 để phân tích (cho nhẹ máy)
     target_route = "88" # Hoặc "1", tùy file config của bạn
@@ -32,41 +88,48 @@ def create_travel_time_dataset():
     stops_coords = df_stops[['StopId', 'Lat', 'Lng', 'Name']].to_dict('records')
 
     dataset = []
+    # Sự kiện ghé trạm được ghi ra đĩa sau mỗi ngày để không giữ cả tháng trong RAM
+    if os.path.exists(STOP_EVENTS_FILE):
+        os.remove(STOP_EVENTS_FILE)
+    events_written = 0
 
-    # 2. Quét qua các file GPS hàng ngày
-    gps_files = glob.glob(os.path.join(GPS_FOLDER, "*.csv"))
+    # 2. Quét qua các file GPS hàng ngày (theo thứ tự ngày)
+    gps_files = sorted(glob.glob(os.path.join(GPS_FOLDER, "*.csv")))
     
     for f_path in gps_files:
         print(f"Đang xử lý file: {os.path.basename(f_path)}")
+        stop_events = []
         try:
-            df_gps = pd.read_csv(f_path)
-            # Chỉ giữ lại các xe thuộc Tuyến 01
-            df_gps = df_gps[df_gps['anonymized_vehicle'].isin(vehicles_route_01)].copy()
-            
-            if df_gps.empty: continue
+            archive = open_archive_for(f_path)
+            if archive is not None:
+                # Có archive (PHA 3 của data_cleaning) -> nhảy thẳng tới dữ liệu từng xe
+                frames = [archive.to_frame(archive.vehicle(v), veh_id=v) for v in vehicles_route_01]
+                frames = [f for f in frames if not f.empty]
+                if not frames: continue
+                df_gps = pd.concat(frames, ignore_index=True)
+            else:
+                df_gps = pd.read_csv(f_path, dtype={'anonymized_vehicle': str})
+                # Chỉ giữ lại các xe thuộc Tuyến 01
+                df_gps = df_gps[df_gps['anonymized_vehicle'].isin(vehicles_route_01)].copy()
 
-            df_gps['datetime'] = pd.to_datetime(df_gps['datetime'])
-            df_gps = df_gps.sort_values(['anonymized_vehicle', 'datetime'])
+                if df_gps.empty: continue
+
+                df_gps['datetime'] = pd.to_datetime(df_gps['datetime'])
+                df_gps = df_gps.sort_values(['anonymized_vehicle', 'datetime'])
 
             # 3. Thuật toán tính thời gian giữa các trạm
             for veh_id, trip_data in df_gps.groupby('anonymized_vehicle'):
                 
-                # Tìm thời điểm xe đi qua từng trạm
-                # Logic đơn giản: Tìm điểm GPS gần trạm nhất (< 100m)
+                # Tìm thời điểm xe đi qua từng trạm (mọi lần ghé trong ngày)
+                visits = find_stop_visits(trip_data, stops_coords)
+                for visit in visits:
+                    stop_events.append({'Date': visit['Arrival'].date(), 'Route': target_route,
+                                        'Vehicle_ID': veh_id, **visit})
+
+                # Dataset thời gian đi: lấy thời điểm đầu tiên chạm vào mỗi trạm
                 stop_times = {}
-                
-                for stop in stops_coords:
-                    # Tính khoảng cách (Manhattan distance cho nhanh)
-                    # 0.001 độ ~ 100m
-                    mask = (abs(trip_data['lat'] - stop['Lat']) < 0.001) & \
-                           (abs(trip_data['lng'] - stop['Lng']) < 0.001)
-                    
-                    nearby_points = trip_data[mask]
-                    
-                    if not nearby_points.empty:
-                        # Lấy thời điểm đầu tiên chạm vào trạm
-                        arrival_time = nearby_points.iloc[0]['datetime']
-                        stop_times[stop['StopId']] = arrival_time
+                for visit in visits:
+                    stop_times.setdefault(visit['StopId'], visit['Arrival'])
 
                 # Tính thời gian di chuyển giữa các cặp trạm liền kề
                 # Giả sử trạm trong file stops_by_var đã sắp xếp theo thứ tự lộ trình
@@ -84,6 +147,7 @@ def create_travel_time_dataset():
                         if 0.5 < duration < 60:
                             dataset.append({
                                 'Date': t1.date(),
+                                'Vehicle_ID': veh_id, # (Date, Vehicle_ID) = 1 chuyến -> đánh giá cả tuyến
                                 'Hour': t1.hour,
                                 'DayOfWeek': t1.dayofweek, # 0=Mon, 6=Sun
                                 'From_Stop': start_node['Name'],
@@ -95,11 +159,17 @@ def create_travel_time_dataset():
         except Exception as e:
             print(f"Lỗi file {f_path}: {e}")
 
+        if stop_events:
+            pd.DataFrame(stop_events).to_csv(STOP_EVENTS_FILE, mode='a', index=False,
+                                             header=(events_written == 0))
+            events_written += len(stop_events)
+
     # 4. Lưu kết quả
     df_final = pd.DataFrame(dataset)
     df_final.to_csv("AI_Training_Data_Route01.csv", index=False)
     print(f"\nHoàn tất! Đã tạo file dữ liệu huấn luyện: AI_Training_Data_Route01.csv ({len(df_final)} dòng)")
     print(df_final.head())
+    print(f"Đã ghi {events_written} sự kiện ghé trạm vào: {STOP_EVENTS_FILE}")
 
 if __name__ == "__main__":
     create_travel_time_dataset()
\ No newline at end of file
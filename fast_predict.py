@@ -0,0 +1,140 @@
+import json
+from statistics import NormalDist
+import numpy as np
+
+# --- CẤU HÌNH ---
+EXPORT_FILE = "bus_travel_time_model_xgb.npz" # Model dạng mảng NumPy (thay cho file .pkl)
+VARIANCE_EXPORT_FILE = "bus_travel_time_model_var.npz" # Model phương sai thời gian đi từng đoạn
+# Các mức phân vị (phần trăm nguyên) của tổng thời gian tuyến, dùng chung cho training.py và smart_schedule.py
+QUANTILES = [50, 85, 95]
+# Tổng nhiều đoạn ~ phân phối chuẩn: P_q = tổng trung bình + z_q * căn(tổng phương sai)
+QUANTILE_Z = {q: NormalDist().inv_cdf(q / 100) for q in QUANTILES}
+
+# =========================================================================
+# XUẤT MODEL: CHUYỂN CÂY XGBOOST THÀNH CÁC MẢNG PHẲNG
+# =========================================================================
+
+def export_booster_arrays(model, output_path=EXPORT_FILE, variance_scale=None):
+    """
+    Dàn phẳng toàn bộ cây của XGBRegressor thành các mảng NumPy và lưu ra file .npz.
+    Mỗi node có: feature, threshold, left, right, missing, value.
+    Node lá trỏ left/right/missing về chính nó để vòng duyệt dừng tại chỗ.
+    variance_scale: hệ số tương quan trong chuyến của model phương sai (xem training.py),
+    None với model trung bình.
+    (Hàm này chỉ chạy lúc training nên được phép dùng xgboost.)
+    """
+    booster = model.get_booster()
+    feature_names = list(booster.feature_names or [])
+    feature_pos = {name: i for i, name in enumerate(feature_names)}
+
+    features, thresholds, lefts, rights, missings, values = [], [], [], [], [], []
+    roots = []
+    max_depth = 0
+
+    for tree_json in booster.get_dump(dump_format='json'):
+        tree = json.loads(tree_json)
+        offset = len(features)
+        roots.append(offset)
+
+        # Gom node theo nodeid (nodeid của XGBoost liên tục từ 0 trong mỗi cây)
+        nodes = {}
+        stack = [(tree, 0)]
+        while stack:
+            node, depth = stack.pop()
+            nodes[node['nodeid']] = node
+            max_depth = max(max_depth, depth)
+            for child in node.get('children', []):
+                stack.append((child, depth + 1))
+
+        for node_id in range(len(nodes)):
+            node = nodes[node_id]
+            if 'leaf' in node:
+                features.append(0)
+                thresholds.append(0.0)
+                lefts.append(offset + node_id)
+                rights.append(offset + node_id)
+                missings.append(offset + node_id)
+                values.append(node['leaf'])
+            else:
+                split = node['split']
+                # Model train bằng numpy (không có tên cột) sẽ có split dạng 'f0', 'f1'...
+                features.append(feature_pos[split] if split in feature_pos else int(split.lstrip('f')))
+                thresholds.append(node['split_condition'])
+                lefts.append(offset + node['yes'])
+                rights.append(offset + node['no'])
+                missings.append(offset + node['missing'])
+                values.append(0.0)
+
+    # base_score có thể ở dạng '5.95E0' hoặc '[5.95E0]' tùy phiên bản XGBoost
+    config = json.loads(booster.save_config())
+    base_score = float(config['learner']['learner_model_param']['base_score'].strip('[]'))
+
+    np.savez(
+        output_path,
+        feature=np.asarray(features, dtype=np.int32),
+        threshold=np.asarray(thresholds, dtype=np.float32),
+        left=np.asarray(lefts, dtype=np.int32),
+        right=np.asarray(rights, dtype=np.int32),
+        missing=np.asarray(missings, dtype=np.int32),
+        value=np.asarray(values, dtype=np.float32),
+        roots=np.asarray(roots, dtype=np.int32),
+        max_depth=np.int32(max_depth),
+        base_score=np.float32(base_score),
+        feature_names=np.asarray(feature_names),
+        variance_scale=np.float64(np.nan if variance_scale is None else variance_scale),
+    )
+    return output_path
+
+# =========================================================================
+# DỰ ĐOÁN: CHỈ DÙNG NUMPY (KHỞI ĐỘNG TRONG VÀI MILI GIÂY)
+# =========================================================================
+
+class FastTreePredictor:
+    """
+    Bộ dự đoán chỉ dùng NumPy cho file .npz do export_booster_arrays tạo ra.
+    Duyệt tất cả các cây cùng lúc: mỗi vòng lặp đi xuống 1 tầng cho mọi (dòng, cây).
+    """
+
+    def __init__(self, path=EXPORT_FILE):
+        with np.load(path) as data:
+            self.feature = data['feature']
+            self.threshold = data['threshold']
+            self.left = data['left']
+            self.right = data['right']
+            self.missing = data['missing']
+            self.value = data['value']
+            self.roots = data['roots']
+            self.max_depth = int(data['max_depth'])
+            self.base_score = np.float32(data['base_score'])
+            self.feature_names = [str(name) for name in data['feature_names']]
+            # Hệ số tương quan trong chuyến; None = model trung bình hoặc file xuất từ bản cũ
+            scale = float(data['variance_scale']) if 'variance_scale' in data.files else np.nan
+            self.variance_scale = None if np.isnan(scale) else scale
+
+    def predict(self, X):
+        """
+        X: mảng 2 chiều (n_rows, n_features) theo đúng thứ tự self.feature_names,
+        hoặc DataFrame có đủ các cột đó. Trả về mảng float32 giống model.predict.
+        """
+        if hasattr(X, 'columns'):
+            X = X[self.feature_names].to_numpy()
+        # XGBoost so sánh ở float32 nên phải ép kiểu để ra cùng nhánh
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+
+        n_rows = X.shape[0]
+        rows = np.arange(n_rows)[:, None]
+        node = np.broadcast_to(self.roots, (n_rows, len(self.roots))).copy()
+
+        for _ in range(self.max_depth):
+            x = X[rows, self.feature[node]]
+            go_left = x < self.threshold[node]
+            node = np.where(np.isnan(x), self.missing[node],
+                            np.where(go_left, self.left[node], self.right[node]))
+
+        return self.value[node].sum(axis=1, dtype=np.float32) + self.base_score
+
+
+def load_predictor(path=EXPORT_FILE):
+    return FastTreePredictor(path)
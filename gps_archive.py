@@ -0,0 +1,170 @@
+import os
+import numpy as np
+import pandas as pd
+
+# =========================================================================
+# KHO LƯU TRỮ GPS DẠNG NHỊ PHÂN (MEMMAP) + CHỈ MỤC THEO XE
+# =========================================================================
+# Mỗi ngày gồm 2 file:
+#   - <tên>.bin       : mảng bản ghi độ rộng cố định, sắp theo (xe, thời gian)
+#   - <tên>_index.npz : danh sách xe + offsets (dữ liệu xe i nằm ở [offsets[i], offsets[i+1]))
+# Đọc bằng numpy.memmap nên lấy 1 xe chỉ là cắt lát, không phải đọc cả file CSV.
+
+GPS_DTYPE = np.dtype([
+    ('ts', '<i8'),         # Thời gian (giây, tính từ 1970-01-01, giữ nguyên giờ địa phương)
+    ('lat', '<f8'),
+    ('lng', '<f8'),
+    ('speed', '<f4'),
+    ('door_up', 'i1'),
+    ('door_down', 'i1'),
+])
+
+def archive_paths(archive_path):
+    """Trả về (file dữ liệu .bin, file chỉ mục .npz) cho một đường dẫn archive (không đuôi)."""
+    return archive_path + '.bin', archive_path + '_index.npz'
+
+def archive_path_for(csv_path):
+    """anonymized_final_clean_2025-04-30.csv -> anonymized_final_clean_2025-04-30 (cùng thư mục)."""
+    return os.path.splitext(csv_path)[0]
+
+def write_archive(df, archive_path):
+    """
+    Ghi DataFrame GPS đã làm sạch thành archive nhị phân.
+    Cần các cột: datetime, lat, lng, speed, anonymized_vehicle, door_up, door_down.
+    """
+    df = df.dropna(subset=['datetime', 'lat', 'lng', 'anonymized_vehicle'])
+
+    # Sắp theo đúng mã chuỗi dùng làm chỉ mục (mã số: "10" đứng trước "2"), rồi theo thời gian
+    vehicle_ids, vehicle_codes = np.unique(df['anonymized_vehicle'].to_numpy().astype(str), return_inverse=True)
+    order = np.lexsort((pd.to_datetime(df['datetime']).to_numpy(), vehicle_codes))
+    df = df.iloc[order]
+    vehicle_codes = vehicle_codes[order]
+    counts = np.bincount(vehicle_codes, minlength=len(vehicle_ids))
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    records = np.empty(len(df), dtype=GPS_DTYPE)
+    records['ts'] = pd.to_datetime(df['datetime']).to_numpy().astype('datetime64[s]').astype(np.int64)
+    records['lat'] = df['lat'].to_numpy(dtype=np.float64)
+    records['lng'] = df['lng'].to_numpy(dtype=np.float64)
+    records['speed'] = df['speed'].to_numpy(dtype=np.float32, na_value=np.nan)
+    records['door_up'] = df['door_up'].fillna(0).to_numpy().astype(np.int8)
+    records['door_down'] = df['door_down'].fillna(0).to_numpy().astype(np.int8)
+
+    data_file, index_file = archive_paths(archive_path)
+    records.tofile(data_file)
+    np.savez(index_file, vehicle_ids=vehicle_ids, offsets=offsets)
+    return len(records)
+
+def write_archive_from_csv(csv_path, archive_path=None):
+    """Chuyển một file CSV đã làm sạch thành archive (mặc định đặt cạnh file CSV)."""
+    archive_path = archive_path or archive_path_for(csv_path)
+    df = pd.read_csv(csv_path, usecols=['datetime', 'lat', 'lng', 'speed',
+                                        'anonymized_vehicle', 'door_up', 'door_down'],
+                     dtype={'anonymized_vehicle': str})
+    return write_archive(df, archive_path)
+
+def open_archive_for(csv_path):
+    """Mở archive đặt cạnh file CSV (PHA 3 của data_cleaning); chưa có archive -> None (đọc CSV như cũ)."""
+    archive_path = archive_path_for(csv_path)
+    if not os.path.exists(archive_paths(archive_path)[0]):
+        return None
+    return GPSArchive(archive_path)
+
+class GPSArchive:
+    """
+    Đọc archive bằng numpy.memmap.
+    vehicle() / vehicle_window() trả về lát cắt zero-copy của file trên đĩa.
+    Mã xe luôn là chuỗi (đọc CSV thì dùng dtype={'anonymized_vehicle': str} cho khớp).
+    """
+
+    def __init__(self, archive_path):
+        data_file, index_file = archive_paths(archive_path)
+        with np.load(index_file) as index:
+            self.vehicle_ids = index['vehicle_ids']
+            self.offsets = index['offsets']
+        self._position = {veh_id: i for i, veh_id in enumerate(self.vehicle_ids)}
+
+        if self.offsets[-1] > 0:
+            self.records = np.memmap(data_file, dtype=GPS_DTYPE, mode='r')
+        else:
+            # np.memmap không mở được file rỗng
+            self.records = np.empty(0, dtype=GPS_DTYPE)
+
+    def __len__(self):
+        return len(self.records)
+
+    def vehicles(self):
+        return list(self.vehicle_ids)
+
+    def vehicle(self, veh_id):
+        """Toàn bộ quỹ đạo của 1 xe (đã sắp theo thời gian). Xe không có -> mảng rỗng."""
+        i = self._position.get(str(veh_id))
+        if i is None:
+            return self.records[:0]
+        return self.records[self.offsets[i]:self.offsets[i + 1]]
+
+    def vehicle_window(self, veh_id, start, end):
+        """Các điểm của 1 xe trong khoảng [start, end) - tìm nhị phân trên cột ts."""
+        rows = self.vehicle(veh_id)
+        lo, hi = np.searchsorted(rows['ts'], [to_ts(start), to_ts(end)])
+        return rows[lo:hi]
+
+    def window(self, start, end, vehicles=None):
+        """
+        Các điểm của nhiều xe (mặc định: tất cả) trong khoảng [start, end).
+        Trả về (bản ghi, mảng mã xe tương ứng từng dòng).
+        """
+        veh_list = self.vehicle_ids if vehicles is None else vehicles
+        parts, owners = [], []
+        for veh_id in veh_list:
+            rows = self.vehicle_window(veh_id, start, end)
+            if len(rows):
+                parts.append(rows)
+                owners.append(np.full(len(rows), str(veh_id), dtype=self.vehicle_ids.dtype))
+        if not parts:
+            return self.records[:0], self.vehicle_ids[:0]
+        return np.concatenate(parts), np.concatenate(owners)
+
+    def to_frame(self, rows, veh_id=None):
+        """Chuyển lát cắt bản ghi thành DataFrame cùng định dạng cột với file CSV."""
+        df = pd.DataFrame({
+            'datetime': pd.to_datetime(np.asarray(rows['ts']), unit='s'),
+            'lat': np.asarray(rows['lat']),
+            'lng': np.asarray(rows['lng']),
+            'speed': np.asarray(rows['speed']),
+            'door_up': np.asarray(rows['door_up']),
+            'door_down': np.asarray(rows['door_down']),
+        })
+        if veh_id is not None:
+            # veh_id: 1 mã xe cho cả lát cắt, hoặc mảng mã xe trả về từ window()
+            df.insert(4, 'anonymized_vehicle', veh_id)
+        return df
+
+def to_ts(value):
+    """datetime / chuỗi / pd.Timestamp -> số giây int64 như cột ts."""
+    return int(np.datetime64(pd.Timestamp(value), 's').astype(np.int64))
+
+if __name__ == "__main__":
+    # Tự kiểm tra: ghi rồi đọc lại một frame có mã xe dạng số (thứ tự số khác thứ tự chuỗi)
+    import tempfile
+    df_check = pd.DataFrame({
+        'datetime': pd.to_datetime(['2025-04-30 06:00:02', '2025-04-30 06:00:00', '2025-04-30 06:00:01',
+                                    '2025-04-30 06:00:00', '2025-04-30 06:00:01']),
+        'lat': [2.0, 10.0, 2.0, 2.0, 10.0],
+        'lng': [0.0, 0.0, 0.0, 0.0, 0.0],
+        'speed': [0.0] * 5,
+        'anonymized_vehicle': [2, 10, 2, 2, 10],
+        'door_up': [0] * 5,
+        'door_down': [0] * 5,
+    })
+    with tempfile.TemporaryDirectory() as tmp:
+        check_path = os.path.join(tmp, 'check')
+        write_archive(df_check, check_path)
+        archive = GPSArchive(check_path)
+        for veh_id in (2, 10):
+            rows = archive.vehicle(veh_id)
+            assert len(rows) == (df_check['anonymized_vehicle'] == veh_id).sum(), veh_id
+            assert (rows['lat'] == veh_id).all(), (veh_id, rows['lat'])
+            assert (np.diff(rows['ts']) >= 0).all(), veh_id
+        del archive
+    print("✅ gps_archive: ghi/đọc archive với mã xe dạng số khớp nhau.")
@@ -3,12 +3,20 @@ import pandas as pd
 import numpy as np
 from shapely.geometry import Point, LineString
 import glob
+from concurrent.futures import ThreadPoolExecutor
+from gps_archive import open_archive_for
 
 # --- CẤU HÌNH ĐƯỜNG DẪN ---
 ROUTE_DIR = r"D:\HCMUT-workplace\BDC_Hackathon\HCMC_bus_routes"
 GPS_DIR = r"D:\HCMUT-workplace\BDC_Hackathon\processed_GPS"
 OUTPUT_FILE = "Master_Vehicle_Route_Mapping.csv"
 
+# --- CẤU HÌNH SO KHỚP ---
+SAMPLE_SIZE = 50            # Số điểm lấy mẫu mỗi xe
+MATCH_THRESHOLD = 0.003     # Khoảng cách trung bình tối đa (độ) để nhận tuyến
+USE_BATCH_SCORING = True    # True: chấm điểm hàng loạt bằng NumPy; False: vòng lặp shapely cũ
+N_WORKERS = os.cpu_count() or 1
+
 # --- 1. HÀM TẠO KHUNG TUYẾN (SKELETON) ---
 def build_route_skeletons(route_dir):
     print("--- Đang học lộ trình của 30 tuyến xe... ---")
@@ -55,7 +63,8 @@ def build_route_skeletons(route_dir):
 def identify_vehicles_in_file(file_path, route_shapes):
     try:
         # Đọc file GPS
-        df_gps = pd.read_csv(file_path, usecols=['lng', 'lat', 'anonymized_vehicle'])
+        df_gps = pd.read_csv(file_path, usecols=['lng', 'lat', 'anonymized_vehicle'],
+                             dtype={'anonymized_vehicle': str})
         
         # === [FIX 1] LỌC DỮ LIỆU RÁC ===
         # Loại bỏ ngay các dòng thiếu tọa độ hoặc thiếu ID xe
@@ -86,8 +95,8 @@ def identify_vehicles_in_file(file_path, route_shapes):
                 continue
 
             # Tối ưu: Lấy mẫu 50 điểm
-            if len(veh_data) > 50:
-                sample = veh_data.sample(50)
+            if len(veh_data) > SAMPLE_SIZE:
+                sample = veh_data.sample(SAMPLE_SIZE)
             else:
                 sample = veh_data
             
@@ -114,7 +123,7 @@ def identify_vehicles_in_file(file_path, route_shapes):
                         best_route = r_id
             
             # Logic ngưỡng sai số (Threshold)
-            if min_score < 0.003:
+            if min_score < MATCH_THRESHOLD:
                 results.append({
                     'Date_File': filename,
                     'Vehicle_ID': veh_id,
@@ -135,6 +144,125 @@ def identify_vehicles_in_file(file_path, route_shapes):
         print(f"Lỗi nghiêm trọng khi đọc file {file_path}: {e}")
         return pd.DataFrame()
 
+# --- 2b. ĐỊNH DANH XE HÀNG LOẠT (NUMPY, KHÔNG TẠO Point) ---
+def build_route_segments(route_shapes):
+    """Chuyển LineString của mỗi tuyến thành 2 mảng điểm đầu/điểm cuối các đoạn thẳng."""
+    route_ids = list(route_shapes)
+    segments = []
+    for r_id in route_ids:
+        coords = np.asarray(route_shapes[r_id].coords, dtype=np.float64)
+        segments.append((coords[:-1], coords[1:]))
+    return route_ids, segments
+
+def point_to_polyline_distance(points, seg_start, seg_end, chunk_cells=2_000_000):
+    """
+    Khoảng cách (cùng đơn vị độ như shapely) từ mỗi điểm tới polyline = min khoảng cách tới các đoạn.
+    Tính theo lô điểm để ma trận (điểm x đoạn) không vượt quá chunk_cells phần tử.
+    """
+    dx = seg_end[:, 0] - seg_start[:, 0]
+    dy = seg_end[:, 1] - seg_start[:, 1]
+    len2 = dx * dx + dy * dy
+    # Đoạn suy biến (2 trạm trùng nhau) -> chiếu về điểm đầu
+    inv_len2 = np.where(len2 > 0, 1.0 / np.where(len2 > 0, len2, 1.0), 0.0)
+
+    result = np.empty(len(points))
+    chunk = max(1, chunk_cells // max(len(dx), 1))
+    for i in range(0, len(points), chunk):
+        px = points[i:i + chunk, 0, None] - seg_start[None, :, 0]   # (c, k)
+        py = points[i:i + chunk, 1, None] - seg_start[None, :, 1]
+        t = np.clip((px * dx + py * dy) * inv_len2, 0.0, 1.0)
+        px -= t * dx
+        py -= t * dy
+        result[i:i + chunk] = np.sqrt((px * px + py * py).min(axis=1))
+    return result
+
+def sample_vehicle_points(offsets, sample_size=SAMPLE_SIZE):
+    """
+    Chọn mẫu tất định cho mọi xe một lần: tối đa sample_size điểm rải đều theo thời gian
+    trong khối [offsets[i], offsets[i+1]). Trả về (chỉ số dòng, xe sở hữu từng mẫu).
+    """
+    counts = np.diff(offsets)
+    n_samples = np.minimum(counts, sample_size)
+    owner = np.repeat(np.arange(len(counts)), n_samples)
+    # Thứ tự mẫu trong từng xe: 0..n_samples-1
+    rank = np.arange(len(owner)) - np.repeat(np.cumsum(n_samples) - n_samples, n_samples)
+    rows = offsets[:-1][owner] + (rank * counts[owner]) // n_samples[owner]
+    return rows, owner
+
+def score_vehicle_chunk(points, owner, n_vehicles, route_segments):
+    """Ma trận (xe x tuyến): khoảng cách trung bình từ các điểm mẫu của xe tới từng tuyến."""
+    n_per_vehicle = np.bincount(owner, minlength=n_vehicles)
+    scores = np.empty((n_vehicles, len(route_segments)))
+    for j, (seg_start, seg_end) in enumerate(route_segments):
+        dist = point_to_polyline_distance(points, seg_start, seg_end)
+        scores[:, j] = np.bincount(owner, weights=dist, minlength=n_vehicles) / np.maximum(n_per_vehicle, 1)
+    return scores
+
+def load_sorted_gps(file_path):
+    """
+    Đọc GPS của 1 ngày đã nhóm theo xe: (mã xe, offsets, lng, lat).
+    Có archive (PHA 3 data_cleaning) thì dùng luôn offsets của archive, không thì sort 1 lần.
+    """
+    archive = open_archive_for(file_path)
+    if archive is not None:
+        return archive.vehicle_ids, archive.offsets, archive.records['lng'], archive.records['lat']
+
+    df_gps = pd.read_csv(file_path, usecols=['lng', 'lat', 'anonymized_vehicle'], dtype={'anonymized_vehicle': str})
+    df_gps = df_gps.dropna(subset=['lng', 'lat', 'anonymized_vehicle'])
+    df_gps['lng'] = pd.to_numeric(df_gps['lng'], errors='coerce')
+    df_gps['lat'] = pd.to_numeric(df_gps['lat'], errors='coerce')
+    df_gps = df_gps.dropna(subset=['lng', 'lat'])
+
+    vehicle_ids, codes = np.unique(df_gps['anonymized_vehicle'].to_numpy(), return_inverse=True)
+    order = np.argsort(codes, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(vehicle_ids)))])
+    return vehicle_ids, offsets, df_gps['lng'].to_numpy()[order], df_gps['lat'].to_numpy()[order]
+
+def identify_vehicles_batch(file_path, route_shapes, n_workers=N_WORKERS):
+    """
+    Giống identify_vehicles_in_file nhưng nhóm dữ liệu 1 lần (sort + offsets), lấy mẫu tất định
+    và tính cả ma trận (xe x tuyến) bằng NumPy, chia theo lô xe cho nhiều luồng.
+    """
+    try:
+        vehicle_ids, offsets, lng, lat = load_sorted_gps(file_path)
+        filename = os.path.basename(file_path)
+
+        if len(vehicle_ids) == 0:
+            print(f"File {filename} không có dữ liệu hợp lệ.")
+            return pd.DataFrame()
+        print(f"Đang xử lý file: {filename} - Tìm thấy {len(vehicle_ids)} xe.")
+
+        route_ids, route_segments = build_route_segments(route_shapes)
+        rows, owner = sample_vehicle_points(offsets)
+        points = np.column_stack([np.asarray(lng)[rows], np.asarray(lat)[rows]])
+
+        # Chia xe thành các lô liên tiếp (mẫu của mỗi xe nằm liền nhau trong points)
+        bounds = np.linspace(0, len(vehicle_ids), min(n_workers, len(vehicle_ids)) + 1).astype(int)
+        sample_bounds = np.searchsorted(owner, bounds)
+
+        def run_chunk(k):
+            lo, hi = sample_bounds[k], sample_bounds[k + 1]
+            return score_vehicle_chunk(points[lo:hi], owner[lo:hi] - bounds[k],
+                                       bounds[k + 1] - bounds[k], route_segments)
+
+        with ThreadPoolExecutor(max_workers=n_workers) as pool:
+            scores = np.vstack(list(pool.map(run_chunk, range(len(bounds) - 1))))
+
+        best = scores.argmin(axis=1)
+        min_score = scores[np.arange(len(vehicle_ids)), best]
+        predicted = np.where(min_score < MATCH_THRESHOLD, np.asarray(route_ids, dtype=object)[best], 'Off-Duty/Unknown')
+
+        return pd.DataFrame({
+            'Date_File': filename,
+            'Vehicle_ID': vehicle_ids,
+            'Predicted_Route_No': predicted,
+            'Confidence_Score': np.round(min_score, 6)
+        })
+
+    except Exception as e:
+        print(f"Lỗi nghiêm trọng khi đọc file {file_path}: {e}")
+        return pd.DataFrame()
+
 # --- 3. MAIN LOOP ---
 if __name__ == "__main__":
     # Bước 1: Build routes
@@ -153,7 +281,10 @@ if __name__ == "__main__":
     # Bước 3: Loop qua từng ngày
     for i, f_path in enumerate(gps_files):
         print(f"[{i+1}/{len(gps_files)}] Processing...", end=" ")
-        df_mapping = identify_vehicles_in_file(f_path, route_shapes)
+        if USE_BATCH_SCORING:
+            df_mapping = identify_vehicles_batch(f_path, route_shapes)
+        else:
+            df_mapping = identify_vehicles_in_file(f_path, route_shapes)
         
         if not df_mapping.empty:
             all_mappings.append(df_mapping)
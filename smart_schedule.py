@@ -1,82 +1,371 @@
 import pandas as pd
 import numpy as np
-import joblib
 from datetime import datetime, timedelta
 import os
+from fast_predict import load_predictor, QUANTILES, QUANTILE_Z
 
 # --- CẤU HÌNH ---
-MODEL_FILE = r"D:\HCMUT-workplace\BDC_Hackathon\bus_travel_time_model_xgb.pkl"
+# Dùng bản xuất dạng mảng (.npz) do training.py tạo -> không cần nạp xgboost/joblib
+MODEL_FILE = r"D:\HCMUT-workplace\BDC_Hackathon\bus_travel_time_model_xgb.npz"
+VARIANCE_MODEL_FILE = r"D:\HCMUT-workplace\BDC_Hackathon\bus_travel_time_model_var.npz"
 STOPS_FILE = r"D:\HCMUT-workplace\BDC_Hackathon\HCMC_bus_routes\88\stops_by_var.csv"
+# Các tuyến cần lập lịch: {Số tuyến: file trạm dừng}
+ROUTE_STOPS_FILES = {"88": STOPS_FILE}
 
-def generate_smart_schedule_real():
-    print(f"--- LẬP LỊCH XUẤT PHÁT THÔNG MINH (DỰA TRÊN TRẠM THỰC TẾ) ---")
-    
-    # 1. Load Model AI
-    if not os.path.exists(MODEL_FILE):
+TARGET_ON_TIME = 0.85           # Xác suất đến đúng giờ mong muốn -> chọn phân vị tương ứng
+PEAK_PERCENTILE = 75            # Giờ có P50 vượt phân vị này của cả ngày -> Cao điểm
+OPERATING_HOURS = range(4, 23)  # Khung giờ có dữ liệu (data_cleaning đã bỏ 23h-4h)
+
+# --- CẤU HÌNH CHẾ ĐỘ TỐI ƯU ĐỘI XE ---
+SCHEDULE_MODE = "slots"         # "slots": từng mốc giờ đến riêng lẻ; "fleet": lập lịch cả ngày cho đội xe
+MAPPING_FILE = r"D:\HCMUT-workplace\BDC_Hackathon\Master_Vehicle_Route_Mapping.csv"
+ARRIVAL_WINDOWS = [("06:00", "06:15"), ("06:30", "06:45"), ("07:00", "07:15"), ("07:30", "07:45"),
+                   ("08:00", "08:15"), ("11:30", "12:00"), ("16:30", "16:45"), ("17:00", "17:15"),
+                   ("17:30", "17:45"), ("18:00", "18:15")]  # Khung giờ cần có xe tới bến cuối
+SERVICE_START = "05:00"         # Chuyến đầu tiên xuất bến không sớm hơn
+SERVICE_END = "21:00"           # Chuyến cuối cùng xuất bến không muộn hơn
+MIN_HEADWAY_MIN = 5             # Giãn cách tối thiểu giữa 2 chuyến (phút)
+MAX_HEADWAY_MIN = 30            # Giãn cách tối đa giữa 2 chuyến (phút)
+LAYOVER_MIN = 10                # Thời gian nghỉ đầu bến trước khi quay đầu (phút)
+DEPARTURE_COST = 1.0            # Chi phí mỗi chuyến (càng ít chuyến càng tốt)
+MISSED_WINDOW_COST = 100.0      # Phạt mỗi khung giờ không có xe tới
+
+def build_travel_time_table(mean_model, variance_model, route_segments, day_of_week):
+    """
+    Dự đoán tổng thời gian mỗi tuyến cho mọi giờ hoạt động trong MỘT lần gọi mỗi model:
+    gộp tất cả (tuyến, giờ, đoạn) thành một ma trận rồi cộng dồn theo tuyến/giờ.
+    Phân vị cả tuyến = tổng trung bình + z_q * căn(hệ số tương quan x tổng phương sai các đoạn)
+    (cộng phân vị từng đoạn sẽ cho phân vị tuyến cao hơn nhiều so với mục tiêu).
+    """
+    hours = np.asarray(OPERATING_HOURS)
+    route_ids = list(route_segments)
+    seg_counts = np.array([route_segments[r] for r in route_ids])
+
+    # Ma trận input: mỗi tuyến lặp (số giờ x số đoạn) dòng
+    route_idx = np.repeat(np.arange(len(route_ids)), seg_counts * len(hours))
+    hour_col = np.concatenate([np.repeat(hours, n) for n in seg_counts])
+    seg_col = np.concatenate([np.tile(np.arange(n), len(hours)) for n in seg_counts])
+    input_data = np.column_stack([hour_col, np.full(len(hour_col), day_of_week), seg_col])
+
+    # Nhóm (tuyến, giờ) để cộng dồn các đoạn
+    group_id = route_idx * len(hours) + np.searchsorted(hours, hour_col)
+    n_groups = len(route_ids) * len(hours)
+
+    def route_totals(predictions):
+        return np.bincount(group_id, weights=predictions, minlength=n_groups)
+
+    table = pd.DataFrame({
+        'Route': np.repeat(route_ids, len(hours)),
+        'Hour': np.tile(hours, len(route_ids)),
+        'Mean': route_totals(mean_model.predict(input_data)),
+    })
+    route_std = np.sqrt(variance_model.variance_scale *
+                        route_totals(np.maximum(variance_model.predict(input_data), 0)))
+    for q in QUANTILES:
+        table[f'P{q}'] = table['Mean'] + QUANTILE_Z[q] * route_std
+
+    # Cờ cao điểm lấy từ chính dữ liệu dự báo của từng tuyến trong ngày
+    peak_threshold = table.groupby('Route')['P50'].transform(lambda x: np.percentile(x, PEAK_PERCENTILE))
+    table['Is_Peak'] = table['P50'] > peak_threshold
+    return table
+
+def prepare_travel_table():
+    """
+    Nạp model + file trạm và dự đoán bảng thời gian đi cả ngày mai cho mọi tuyến.
+    Trả về (bảng thời gian đi, phân vị mục tiêu, ngày mục tiêu) hoặc None nếu thiếu file.
+    """
+    # 1. Load Model AI (model trung bình + model phương sai từng đoạn)
+    if not os.path.exists(MODEL_FILE) or not os.path.exists(VARIANCE_MODEL_FILE):
         print("Lỗi: Chưa có file model. Hãy chạy bước train trước!")
-        return
-    model = joblib.load(MODEL_FILE)
+        return None
+    model = load_predictor(MODEL_FILE)
+    variance_model = load_predictor(VARIANCE_MODEL_FILE)
+    if variance_model.variance_scale is None:
+        print(f"Lỗi: {VARIANCE_MODEL_FILE} không phải model phương sai. Hãy train lại!")
+        return None
 
-    # 2. Đọc file Trạm dừng
-    if not os.path.exists(STOPS_FILE):
-        print(f"Lỗi: Không tìm thấy file trạm dừng tại {STOPS_FILE}")
-        return
-    
-    df_stops = pd.read_csv(STOPS_FILE)
+    # Phân vị nhỏ nhất đạt xác suất đúng giờ mong muốn
+    target_q = next((q for q in QUANTILES if q >= TARGET_ON_TIME * 100), QUANTILES[-1])
 
-    real_num_segments = len(df_stops) - 1
-    
-    print(f"Đã đọc file trạm dừng: {len(df_stops)} trạm.")
-    print(f"-> Hệ thống sẽ tính toán tổng thời gian của {real_num_segments} đoạn đường nối tiếp nhau.\n")
+    # 2. Đọc file Trạm dừng
+    route_segments = {}
+    for route_id, stops_file in ROUTE_STOPS_FILES.items():
+        if not os.path.exists(stops_file):
+            print(f"Lỗi: Không tìm thấy file trạm dừng tại {stops_file}")
+            return None
+        df_stops = pd.read_csv(stops_file)
+        route_segments[route_id] = len(df_stops) - 1
+        print(f"Tuyến {route_id}: {len(df_stops)} trạm -> {route_segments[route_id]} đoạn đường nối tiếp nhau.")
 
     # 3. Thiết lập ngày mai
     tomorrow = datetime.now() + timedelta(days=1)
-    target_date = tomorrow.date()
     day_of_week = tomorrow.weekday()
-    
+
+    print(f"\nĐang tính toán P{'/P'.join(map(str, QUANTILES))} cho toàn bộ tuyến... "
+          f"(Mục tiêu đúng giờ {TARGET_ON_TIME * 100:.0f}% -> dùng P{target_q})")
+
+    # 4. Dự đoán cả ngày trong một lượt, sau đó chỉ tra bảng theo giờ
+    travel_table = build_travel_time_table(model, variance_model, route_segments, day_of_week)
+    return travel_table, target_q, tomorrow.date()
+
+def generate_smart_schedule_real():
+    print(f"--- LẬP LỊCH XUẤT PHÁT THÔNG MINH (DỰA TRÊN TRẠM THỰC TẾ) ---")
+
+    prepared = prepare_travel_table()
+    if prepared is None:
+        return
+    travel_table, target_q, target_date = prepared
+    route_ids = travel_table['Route'].unique()
+
     start_target = datetime.combine(target_date, datetime.strptime("06:00", "%H:%M").time())
     end_target   = datetime.combine(target_date, datetime.strptime("09:00", "%H:%M").time())
-    
-    current_target = start_target
-    schedule_table = []
 
-    print("Đang tính toán... (Vui lòng đợi AI quét qua toàn bộ lộ trình)")
+    travel_lookup = travel_table.set_index(['Route', 'Hour'])
 
-    while current_target <= end_target:
-        hour_check = current_target.hour
-
-        # --- Tạo input data cho tất cả segments ---
-        input_data = pd.DataFrame({
-            'Hour': [hour_check] * real_num_segments,
-            'DayOfWeek': [day_of_week] * real_num_segments,
-            'Segment_Index': list(range(real_num_segments))
-        })
-        
-        # --- Dự đoán ---
-        predictions = model.predict(input_data)
+    schedule_table = []
+    for route_id in route_ids:
+        current_target = start_target
+        while current_target <= end_target:
+            row = travel_lookup.loc[(route_id, current_target.hour)]
 
-        # --- FIX LỖI: chuyển numpy.float32 -> float ---
-        total_duration = float(np.sum(predictions))
+            # --- Tính giờ xuất phát theo phân vị mục tiêu ---
+            total_duration = float(row[f'P{target_q}'])
+            departure_time = current_target - timedelta(minutes=total_duration)
 
-        # --- Tính giờ xuất phát ---
-        departure_time = current_target - timedelta(minutes=total_duration)
+            entry = {
+                "Tuyến": route_id,
+                "Giờ Đến Đích (Target)": current_target.strftime("%H:%M"),
+                "Tổng Thời Gian (Phút)": round(float(row['Mean']), 2),
+            }
+            for q in QUANTILES:
+                entry[f"P{q} (Phút)"] = round(float(row[f'P{q}']), 2)
+            entry["GIỜ XUẤT BẾN GỢI Ý"] = departure_time.strftime("%H:%M")
+            entry["Trạng Thái"] = "🔴 Cao điểm" if row['Is_Peak'] else "🟢 Bình thường"
+            schedule_table.append(entry)
 
-        schedule_table.append({
-            "Giờ Đến Đích (Target)": current_target.strftime("%H:%M"),
-            "Tổng Thời Gian (Phút)": round(total_duration, 2),
-            "GIỜ XUẤT BẾN GỢI Ý": departure_time.strftime("%H:%M"),
-            "Trạng Thái": "🔴 Cao điểm" if total_duration > 45 else "🟢 Bình thường"
-        })
-        
-        current_target += timedelta(minutes=15)
+            current_target += timedelta(minutes=15)
 
     # 5. Xuất kết quả
     df_schedule = pd.DataFrame(schedule_table)
     print("\nBẢNG KẾT QUẢ CHI TIẾT:")
     print(df_schedule.to_string(index=False))
-    
+
     df_schedule.to_csv("Real_Smart_Schedule.csv", index=False)
     print("\n-> Đã lưu vào file: Real_Smart_Schedule.csv")
 
+# =========================================================================
+# CHẾ ĐỘ TỐI ƯU ĐỘI XE: LẬP LỊCH CẢ NGÀY CÓ RÀNG BUỘC GIÃN CÁCH + SỐ XE
+# =========================================================================
+
+def to_minutes(hhmm):
+    h, m = map(int, hhmm.split(':'))
+    return h * 60 + m
+
+def load_fleet_sizes(mapping_file=MAPPING_FILE):
+    """Số xe mỗi tuyến = số xe nhiều nhất từng chạy tuyến đó trong một ngày (Master_Vehicle_Route_Mapping.csv)."""
+    df_map = pd.read_csv(mapping_file, dtype={'Predicted_Route_No': str})
+    df_map = df_map[df_map['Predicted_Route_No'] != 'Off-Duty/Unknown']
+    per_day = df_map.groupby(['Predicted_Route_No', 'Date_File'])['Vehicle_ID'].nunique()
+    return per_day.groupby(level=0).max().to_dict()
+
+def merge_windows(windows):
+    """Sắp xếp và gộp các khung giờ chồng nhau -> mảng (bắt đầu, kết thúc) theo phút."""
+    merged = []
+    for a, b in sorted((to_minutes(a), to_minutes(b)) for a, b in windows):
+        if merged and a <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], b)
+        else:
+            merged.append([a, b])
+    return np.array(merged, dtype=np.float64).reshape(-1, 2)
+
+def optimize_fleet_timetable(travel_table, arrival_windows, fleet_sizes, quantile_col='P85',
+                             min_headway=MIN_HEADWAY_MIN, max_headway=MAX_HEADWAY_MIN,
+                             service_start=SERVICE_START, service_end=SERVICE_END, verbose=True):
+    """
+    Quy hoạch động trên lưới 1 phút, giải cùng lúc cho mọi tuyến (mảng tuyến x phút).
+    - Trạng thái: chuyến vừa xuất bến lúc t. Chuyến kế tiếp cách t từ h_min(t) tới h_cap(t) phút.
+    - h_min(t) = max(min_headway, vòng quay lớn nhất trong cửa sổ trước t / số xe): đủ xe quay đầu
+      để chạy chuyến kế tiếp, với vòng quay = 2 x thời gian đi (theo quantile_col) + LAYOVER_MIN.
+    - h_cap(t) = max(max_headway, h_min(t)): chỉ nới max_headway ở những phút không đủ xe (có cảnh báo).
+    - Chi phí = DEPARTURE_COST mỗi chuyến + MISSED_WINDOW_COST mỗi khung giờ đến không có xe nào.
+    arrival_windows: danh sách ("HH:MM", "HH:MM") dùng chung, hoặc dict {tuyến: danh sách}.
+    fleet_sizes: {tuyến: số xe}; tuyến không có số xe bị bỏ qua (không tự giả định 1 xe).
+    verbose: in cảnh báo theo từng tuyến (tắt khi đo thời gian chạy, kết quả trả về vẫn đủ).
+    Trả về (DataFrame lịch xuất bến - mỗi chuyến 1 dòng, {tuyến: số khung giờ đến bị bỏ lỡ},
+    {tuyến: giãn cách tối đa đã nới (phút)} cho các tuyến không đủ xe giữ max_headway).
+    """
+    route_ids = []
+    for route_id in travel_table['Route'].unique():
+        if fleet_sizes.get(route_id, 0) < 1:
+            if verbose:
+                print(f"⚠️ Tuyến {route_id}: không có số xe trong file mapping -> bỏ qua, không lập lịch.")
+        else:
+            route_ids.append(route_id)
+    n_routes = len(route_ids)
+    if n_routes == 0:
+        return pd.DataFrame(), {}, {}
+    grid = np.arange(to_minutes(service_start), to_minutes(service_end) + 1)
+    n_steps = len(grid)
+
+    # Thời gian đi (phút) cho từng (tuyến, phút xuất bến): giá trị mỗi giờ đặt ở giữa giờ (hh:30) rồi
+    # nội suy tuyến tính theo phút -> giờ đến không nhảy bậc lúc đổi giờ (ngoài khung giờ lấy giờ gần nhất)
+    hourly = travel_table.pivot(index='Route', columns='Hour', values=quantile_col).reindex(route_ids)
+    hourly = hourly.reindex(columns=range(24)).ffill(axis=1).bfill(axis=1).to_numpy()
+    anchors = np.arange(24) * 60 + 30
+    pos = np.clip(np.searchsorted(anchors, grid, side='right') - 1, 0, 22)
+    weight = np.clip((grid - anchors[pos]) / 60.0, 0.0, 1.0)
+    travel = hourly[:, pos] * (1 - weight) + hourly[:, pos + 1] * weight   # (tuyến, phút)
+    arrival = grid[None, :] + travel
+
+    fleet = np.array([int(fleet_sizes[r]) for r in route_ids])
+    cycle = 2 * travel + LAYOVER_MIN
+    # Lấy vòng quay lớn nhất trong cửa sổ phía trước: F chuyến liên tiếp sau chuyến t luôn cách nhau
+    # đủ cycle(t) kể cả khi vòng quay tăng dần lúc vào cao điểm. Cửa sổ = vòng quay dài nhất của chính tuyến đó
+    cycle_cover = np.vstack([
+        pd.Series(route_cycle).rolling(int(np.ceil(route_cycle.max())), min_periods=1).max().to_numpy()
+        for route_cycle in cycle
+    ])
+    h_min = np.maximum(min_headway, np.ceil(cycle_cover / fleet[:, None])).astype(np.int64)
+    # Không đủ xe để giữ max_headway -> chỉ nới ở những phút h_min vượt max_headway
+    h_cap = np.maximum(max_headway, h_min)
+    h_max = int(h_cap.max())
+    relaxed_headways = {}
+    for r, route_id in enumerate(route_ids):
+        relaxed = np.flatnonzero(h_min[r] > max_headway)
+        if len(relaxed):
+            relaxed_headways[route_id] = int(h_cap[r].max())
+        if len(relaxed) and verbose:
+            a, b = grid[relaxed[0]], grid[relaxed[-1]]
+            print(f"⚠️ Tuyến {route_id}: {fleet[r]} xe không đủ giữ giãn cách {max_headway} phút trong "
+                  f"{a // 60:02d}:{a % 60:02d}-{b // 60:02d}:{b % 60:02d} -> nới tới {relaxed_headways[route_id]} phút.")
+
+    # Với khung giờ đã gộp (không chồng nhau, tăng dần), số khung bị bỏ lỡ giữa 2 lần đến x < y
+    # = max(0, #{kết thúc < y} - #{bắt đầu <= x})
+    ends_before = np.zeros((n_routes, n_steps))
+    starts_upto = np.zeros((n_routes, n_steps))
+    n_windows = np.zeros(n_routes)
+    route_windows = []
+    for r, route_id in enumerate(route_ids):
+        win = arrival_windows.get(route_id, []) if isinstance(arrival_windows, dict) else arrival_windows
+        win = merge_windows(win)
+        route_windows.append(win)
+        n_windows[r] = len(win)
+        ends_before[r] = np.searchsorted(win[:, 1], arrival[r], side='left')
+        starts_upto[r] = np.searchsorted(win[:, 0], arrival[r], side='right')
+        # Khung giờ không chuyến nào trong giờ phục vụ tới kịp (vd tuyến dài + khung đầu ngày quá sớm)
+        for a, b in (win[~windows_hit(win, arrival[r])] if verbose else []):
+            print(f"⚠️ Tuyến {route_id}: khung giờ đến {int(a) // 60:02d}:{int(a) % 60:02d}-"
+                  f"{int(b) // 60:02d}:{int(b) % 60:02d} không thể tới kịp trong giờ phục vụ "
+                  f"{service_start}-{service_end}.")
+
+    cost = np.full((n_routes, n_steps), np.inf)
+    parent = np.full((n_routes, n_steps), -1, dtype=np.int64)
+
+    # Chuyến đầu tiên phải xuất bến trong h_cap phút đầu; bỏ lỡ mọi khung kết thúc trước nó
+    first = grid[None, :] - grid[0] < h_cap[:, :1]
+    cost[first] = (DEPARTURE_COST + MISSED_WINDOW_COST * ends_before)[first]
+
+    rows = np.arange(n_routes)[:, None]
+    for i in range(1, n_steps):
+        prev = np.arange(max(0, i - h_max), i)
+        gap = i - prev
+        feasible = (gap[None, :] >= h_min[:, prev]) & (gap[None, :] <= h_cap[:, prev])
+        missed = np.maximum(0, ends_before[:, i, None] - starts_upto[:, prev])
+        candidate = np.where(feasible, cost[:, prev] + DEPARTURE_COST + MISSED_WINDOW_COST * missed, np.inf)
+        best = candidate.argmin(axis=1)
+        best_cost = candidate[rows[:, 0], best]
+        better = best_cost < cost[:, i]
+        cost[better, i] = best_cost[better]
+        parent[better, i] = prev[best[better]]
+
+    # Chuyến cuối phải xuất bến trong h_cap phút cuối; bỏ lỡ mọi khung bắt đầu sau nó
+    last_ok = grid[-1] - grid[None, :] < h_cap
+    total = np.where(last_ok, cost + MISSED_WINDOW_COST * (n_windows[:, None] - starts_upto), np.inf)
+
+    timetable = []
+    missed_windows = {}
+    for r, route_id in enumerate(route_ids):
+        i = int(total[r].argmin())
+        if not np.isfinite(total[r, i]):
+            if verbose:
+                print(f"⚠️ Tuyến {route_id}: không tìm được lịch thỏa ràng buộc giãn cách.")
+            missed_windows[route_id] = len(route_windows[r])
+            continue
+        trip_steps = []
+        while i >= 0:
+            trip_steps.append(i)
+            i = parent[r, i]
+        missed_windows[route_id] = int((~windows_hit(route_windows[r], arrival[r, trip_steps])).sum())
+        for trip_no, i in enumerate(reversed(trip_steps), start=1):
+            timetable.append({
+                'Route': route_id,
+                'Trip': trip_no,
+                'Departure_Min': int(grid[i]),
+                'Arrival_Min': float(arrival[r, i]),
+                'Cycle_Min': float(cycle[r, i]),
+                'Fleet_Size': int(fleet[r]),
+            })
+    return pd.DataFrame(timetable), missed_windows, relaxed_headways
+
+def windows_hit(windows, arrivals):
+    """Mảng bool: khung giờ [bắt đầu, kết thúc] nào có ít nhất 1 lần đến (arrivals theo phút)."""
+    arrivals = np.sort(np.asarray(arrivals, dtype=np.float64))
+    first_after_start = np.searchsorted(arrivals, windows[:, 0], side='left')
+    return first_after_start < np.searchsorted(arrivals, windows[:, 1], side='right')
+
+def check_fleet_feasibility(timetable):
+    """
+    Mô phỏng đội xe của từng tuyến: mỗi chuyến lấy xe rảnh sớm nhất, xe quay lại sau Cycle_Min phút.
+    Trả về {tuyến: số chuyến không có xe sẵn sàng đúng giờ}.
+    """
+    violations = {}
+    for route_id, trips in timetable.groupby('Route', sort=False):
+        ready = np.full(int(trips['Fleet_Size'].iloc[0]), -np.inf)
+        late = 0
+        for dep, cyc in zip(trips['Departure_Min'].to_numpy(), trips['Cycle_Min'].to_numpy()):
+            k = int(ready.argmin())
+            if ready[k] > dep + 1e-9:
+                late += 1
+            ready[k] = max(ready[k], dep) + cyc
+        violations[route_id] = late
+    return violations
+
+def generate_fleet_timetable():
+    print(f"--- TỐI ƯU LỊCH XUẤT BẾN CẢ NGÀY CHO ĐỘI XE ---")
+
+    prepared = prepare_travel_table()
+    if prepared is None:
+        return
+    travel_table, target_q, _ = prepared
+
+    if not os.path.exists(MAPPING_FILE):
+        print(f"Lỗi: Không tìm thấy file {MAPPING_FILE}. Hãy chạy mapping.py trước!")
+        return
+    fleet_sizes = load_fleet_sizes(MAPPING_FILE)
+
+    timetable, missed_windows, relaxed_headways = optimize_fleet_timetable(
+        travel_table, ARRIVAL_WINDOWS, fleet_sizes, quantile_col=f'P{target_q}')
+    if timetable.empty:
+        print("Không lập được lịch nào.")
+        return
+    violations = check_fleet_feasibility(timetable)
+
+    timetable['GIỜ XUẤT BẾN'] = timetable['Departure_Min'].map(lambda m: f"{m // 60:02d}:{m % 60:02d}")
+    timetable[f'GIỜ ĐẾN (P{target_q})'] = timetable['Arrival_Min'].map(
+        lambda m: f"{int(m) // 60:02d}:{int(m) % 60:02d}")
+
+    for route_id, trips in timetable.groupby('Route', sort=False):
+        relaxed = (f", giãn cách nới tới {relaxed_headways[route_id]} phút"
+                   if route_id in relaxed_headways else "")
+        print(f"Tuyến {route_id}: {len(trips)} chuyến, {int(trips['Fleet_Size'].iloc[0])} xe, "
+              f"{violations[route_id]} chuyến thiếu xe, {missed_windows[route_id]} khung giờ đến bị bỏ lỡ{relaxed}.")
+
+    timetable.to_csv("Fleet_Smart_Timetable.csv", index=False)
+    print("\n-> Đã lưu vào file: Fleet_Smart_Timetable.csv")
+
 if __name__ == "__main__":
-    generate_smart_schedule_real()
+    if SCHEDULE_MODE == "fleet":
+        generate_fleet_timetable()
+    else:
+        generate_smart_schedule_real()
+
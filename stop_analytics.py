@@ -0,0 +1,188 @@
+import pandas as pd
+import numpy as np
+import os
+import time
+
+# --- CẤU HÌNH ---
+STOP_EVENTS_FILE = "Stop_Events.csv"            # Đầu ra của data_train.py (mọi lần xe ghé trạm)
+SUMMARY_FILE = "Stop_Hourly_Summary.csv"        # Bảng tóm tắt theo (tuyến, trạm, giờ) cho smart_schedule
+BUNCHING_FILE = "Bunching_Incidents.csv"        # Danh sách từng lần dồn chuyến
+
+BUNCHING_HEADWAY_MIN = 2.0   # Hai xe tới cùng trạm cách nhau ít hơn (phút) -> dồn chuyến
+CHUNK_ROWS = 200_000         # Số dòng sự kiện đọc mỗi lần (giới hạn bộ nhớ)
+
+# Histogram cố định -> gộp nhiều ngày chỉ là cộng mảng đếm, bộ nhớ không phụ thuộc số ngày
+HEADWAY_BINS = np.arange(0, 180.5, 0.5)      # phút (ô cuối gom mọi giá trị >= 180)
+DWELL_BINS = np.arange(0, 905, 5)            # giây (ô cuối gom mọi giá trị >= 900)
+
+KEY_COLS = ['Route', 'StopId', 'Stop_Index', 'Hour']
+
+# =========================================================================
+# XỬ LÝ 1 NGÀY: SORT-MERGE SỰ KIỆN CỦA MỌI XE TRÊN TUYẾN
+# =========================================================================
+
+def compute_day_headways(df_day):
+    """
+    Ghép sự kiện của mọi xe theo (tuyến, trạm) và sắp theo giờ tới trạm:
+    headway = khoảng cách (phút) giữa 2 xe KHÁC NHAU liên tiếp tới cùng một trạm.
+    Lần ghé lặp lại của cùng một xe ngay sau chính nó (lần ghé bị tách do mất tín hiệu,
+    hoặc xe đi qua ô trạm ở chiều ngược lại) không có headway và không làm mốc cho xe sau.
+    Dòng đầu tiên của mỗi trạm trong ngày không có headway (NaN).
+    """
+    df_day = df_day.sort_values(['Route', 'StopId', 'Arrival'], kind='stable').reset_index(drop=True)
+    same_stop = (df_day['Route'].eq(df_day['Route'].shift(1)) &
+                 df_day['StopId'].eq(df_day['StopId'].shift(1)))
+    repeat = same_stop & df_day['Vehicle_ID'].eq(df_day['Vehicle_ID'].shift(1))
+
+    # Chỉ nối các lần ghé đầu tiên của mỗi chuỗi xe
+    firsts = df_day[~repeat]
+    first_same_stop = same_stop[~repeat]
+    headway = firsts['Arrival'].diff().dt.total_seconds() / 60.0
+    df_day['Headway_Minutes'] = headway.where(first_same_stop)
+    df_day['Prev_Vehicle_ID'] = firsts['Vehicle_ID'].shift(1).where(first_same_stop)
+    df_day['Hour'] = df_day['Arrival'].dt.hour
+    return df_day
+
+def histogram_by_key(key_codes, values, bins, n_keys):
+    """Đếm values vào bins cho từng nhóm key (bỏ NaN). Trả về mảng (n_keys, len(bins))."""
+    valid = ~np.isnan(values)
+    bin_idx = np.clip(np.searchsorted(bins, values[valid], side='right') - 1, 0, len(bins) - 1)
+    counts = np.zeros((n_keys, len(bins)), dtype=np.int64)
+    np.add.at(counts, (key_codes[valid], bin_idx), 1)
+    return counts
+
+class StopStatsAccumulator:
+    """
+    Tích lũy thống kê theo (tuyến, trạm, giờ) qua nhiều ngày:
+    histogram headway/dwell + tổng/đếm chính xác để tính trung bình + số lần dồn chuyến.
+    """
+
+    def __init__(self):
+        self.index = {}   # key -> dòng trong các mảng bên dưới
+        self.headway_hist = np.zeros((0, len(HEADWAY_BINS)), dtype=np.int64)
+        self.dwell_hist = np.zeros((0, len(DWELL_BINS)), dtype=np.int64)
+        self.sums = np.zeros((0, 4))  # headway_sum, headway_sq_sum, dwell_sum, bunching_count
+
+    def _rows_for(self, keys):
+        new_keys = [k for k in keys if k not in self.index]
+        if new_keys:
+            start = len(self.index)
+            for i, k in enumerate(new_keys):
+                self.index[k] = start + i
+            grow = len(new_keys)
+            self.headway_hist = np.vstack([self.headway_hist, np.zeros((grow, len(HEADWAY_BINS)), dtype=np.int64)])
+            self.dwell_hist = np.vstack([self.dwell_hist, np.zeros((grow, len(DWELL_BINS)), dtype=np.int64)])
+            self.sums = np.vstack([self.sums, np.zeros((grow, 4))])
+        return np.array([self.index[k] for k in keys], dtype=np.int64)
+
+    def add_day(self, df_day):
+        codes, keys = pd.MultiIndex.from_frame(df_day[KEY_COLS]).factorize()
+        rows = self._rows_for(list(keys))
+
+        headway = df_day['Headway_Minutes'].to_numpy(dtype=np.float64)
+        # Chỉ tính dwell cho các lần ghé có mở cửa (xe chạy thẳng qua trạm không phải dừng đón khách)
+        dwell = df_day['Dwell_Seconds'].where(df_day['Door_Open'].astype(bool)).to_numpy(dtype=np.float64)
+        bunched = (headway < BUNCHING_HEADWAY_MIN).astype(np.float64)  # NaN < x -> False
+
+        self.headway_hist[rows] += histogram_by_key(codes, headway, HEADWAY_BINS, len(keys))
+        self.dwell_hist[rows] += histogram_by_key(codes, dwell, DWELL_BINS, len(keys))
+        day_sums = np.column_stack([
+            np.bincount(codes, weights=np.nan_to_num(headway), minlength=len(keys)),
+            np.bincount(codes, weights=np.nan_to_num(headway) ** 2, minlength=len(keys)),
+            np.bincount(codes, weights=np.nan_to_num(dwell), minlength=len(keys)),
+            np.bincount(codes, weights=bunched, minlength=len(keys)),
+        ])
+        self.sums[rows] += day_sums
+
+    def summary(self):
+        """Bảng tóm tắt gọn: mỗi (tuyến, trạm, giờ) một dòng."""
+        keys = pd.DataFrame(list(self.index), columns=KEY_COLS)
+        n_headway = self.headway_hist.sum(axis=1)
+        n_dwell = self.dwell_hist.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            headway_mean = self.sums[:, 0] / n_headway
+            headway_std = np.sqrt(np.maximum(self.sums[:, 1] / n_headway - headway_mean ** 2, 0))
+            table = keys.assign(
+                Headway_Count=n_headway,
+                Headway_Mean=headway_mean,
+                Headway_P50=hist_quantile(self.headway_hist, HEADWAY_BINS, 0.50),
+                Headway_P90=hist_quantile(self.headway_hist, HEADWAY_BINS, 0.90),
+                Headway_CV=headway_std / headway_mean,
+                Dwell_Count=n_dwell,
+                Dwell_Mean_Sec=self.sums[:, 2] / n_dwell,
+                Dwell_P50_Sec=hist_quantile(self.dwell_hist, DWELL_BINS, 0.50),
+                Dwell_P90_Sec=hist_quantile(self.dwell_hist, DWELL_BINS, 0.90),
+                Bunching_Count=self.sums[:, 3].astype(np.int64),
+                Bunching_Rate=self.sums[:, 3] / n_headway,
+            )
+        return table.sort_values(KEY_COLS).round(3).reset_index(drop=True)
+
+def hist_quantile(hist, bins, q):
+    """Phân vị xấp xỉ từ histogram (lấy cận dưới của ô chứa phân vị). Nhóm rỗng -> NaN."""
+    total = hist.sum(axis=1)
+    cum = np.cumsum(hist, axis=1)
+    idx = (cum < (q * total)[:, None]).sum(axis=1)
+    result = bins[np.minimum(idx, len(bins) - 1)].astype(np.float64)
+    result[total == 0] = np.nan
+    return result
+
+# =========================================================================
+# CHƯƠNG TRÌNH CHÍNH: ĐỌC TỪNG KHỐI, XỬ LÝ TỪNG NGÀY TRỌN VẸN
+# =========================================================================
+
+def iter_event_days(events_file, chunk_rows=CHUNK_ROWS):
+    """
+    Đọc file sự kiện theo khối và trả về lần lượt từng ngày trọn vẹn.
+    data_train.py ghi sự kiện theo thứ tự ngày, nên chỉ cần giữ lại ngày cuối của mỗi khối
+    (có thể còn tiếp ở khối sau) -> bộ nhớ ~ 1 ngày + 1 khối.
+    """
+    carry = None
+    for chunk in pd.read_csv(events_file, chunksize=chunk_rows, parse_dates=['Arrival', 'Departure'],
+                             dtype={'Route': str, 'Vehicle_ID': str}):
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        last_date = chunk['Date'].iloc[-1]
+        for date, df_day in chunk[chunk['Date'] != last_date].groupby('Date', sort=False):
+            yield date, df_day
+        carry = chunk[chunk['Date'] == last_date]
+    if carry is not None and not carry.empty:
+        yield carry['Date'].iloc[0], carry
+
+def run_stop_analytics(events_file=STOP_EVENTS_FILE):
+    print("--- PHÂN TÍCH HEADWAY / DWELL / DỒN CHUYẾN TẠI TRẠM ---")
+    if not os.path.exists(events_file):
+        print(f"Lỗi: Chưa có file {events_file}. Hãy chạy data_train.py trước!")
+        return None
+
+    start_time = time.time()
+    accumulator = StopStatsAccumulator()
+    n_days = 0
+    n_incidents = 0
+    if os.path.exists(BUNCHING_FILE):
+        os.remove(BUNCHING_FILE)
+
+    for date, df_day in iter_event_days(events_file):
+        df_day = compute_day_headways(df_day)
+        accumulator.add_day(df_day)
+
+        # Ghi ngay các lần dồn chuyến của ngày này ra đĩa
+        incidents = df_day[df_day['Headway_Minutes'] < BUNCHING_HEADWAY_MIN]
+        if not incidents.empty:
+            incidents[['Date', 'Route', 'StopId', 'Stop_Index', 'Hour', 'Arrival',
+                       'Vehicle_ID', 'Prev_Vehicle_ID', 'Headway_Minutes']].to_csv(
+                BUNCHING_FILE, mode='a', index=False, header=(n_incidents == 0))
+            n_incidents += len(incidents)
+
+        n_days += 1
+        print(f"    ✅ Ngày {date}: {len(df_day)} lần ghé trạm, {len(incidents)} lần dồn chuyến.")
+
+    df_summary = accumulator.summary()
+    df_summary.to_csv(SUMMARY_FILE, index=False)
+
+    print(f"\nĐã phân tích {n_days} ngày trong {time.time() - start_time:.2f} giây.")
+    print(f"-> Bảng tóm tắt ({len(df_summary)} dòng): {SUMMARY_FILE}")
+    print(f"-> Danh sách dồn chuyến ({n_incidents} lần): {BUNCHING_FILE}")
+    return df_summary
+
+if __name__ == "__main__":
+    run_stop_analytics()
@@ -1,15 +1,80 @@
 import pandas as pd
 import numpy as np
 from xgboost import XGBRegressor  # <--- THAY ĐỔI QUAN TRỌNG
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import train_test_split, GroupShuffleSplit
 from sklearn.metrics import mean_absolute_error
 import matplotlib.pyplot as plt
 import joblib
 import os
+from fast_predict import export_booster_arrays, load_predictor, QUANTILES, QUANTILE_Z, VARIANCE_EXPORT_FILE
 
 # --- CẤU HÌNH ---
 DATA_FILE = "AI_Training_Data_Route01.csv"
 MODEL_FILE = "bus_travel_time_model_xgb.pkl" # Đổi tên file model chút cho ngầu
+EXPORT_FILE = "bus_travel_time_model_xgb.npz" # Bản xuất dạng mảng cho smart_schedule (không cần xgboost)
+EXPORT_TOLERANCE = 1e-3 # Sai lệch tối đa (phút) cho phép giữa bản xuất và model.predict
+
+def export_and_verify(model, X_check, export_file=EXPORT_FILE, variance_scale=None):
+    """
+    Xuất cây XGBoost ra file .npz rồi nạp lại bằng bộ dự đoán NumPy
+    để kiểm tra kết quả khớp với model.predict.
+    """
+    export_booster_arrays(model, export_file, variance_scale)
+    fast_model = load_predictor(export_file)
+
+    max_diff = float(np.max(np.abs(fast_model.predict(X_check) - model.predict(X_check))))
+    if max_diff > EXPORT_TOLERANCE:
+        print(f"❌ Bản xuất lệch {max_diff:.6f} phút so với model.predict! Đã xóa {export_file}.")
+        os.remove(export_file)
+        return False
+
+    print(f"Đã xuất model dạng mảng vào: {export_file} (sai lệch tối đa {max_diff:.2e} phút)")
+    return True
+
+def complete_trip_sums(trips, n_segments, **columns):
+    """Cộng từng cột theo chuyến (Date + Vehicle_ID), chỉ giữ các chuyến đi đủ n_segments đoạn."""
+    grouped = pd.DataFrame({name: np.asarray(values) for name, values in columns.items()}).groupby(trips.to_numpy())
+    sums = grouped.sum()
+    return sums[grouped.size() == n_segments]
+
+def train_variance_model(model, X_train, y_train, X_test, y_test, trips_train, trips_test, n_segments):
+    """
+    Train model phương sai thời gian đi từng đoạn (học bình phương sai số của model trung bình) và xuất ra .npz.
+    Phân vị tổng tuyến = tổng trung bình + z_q * căn(hệ số x tổng phương sai): cộng phân vị từng đoạn
+    sẽ ra phân vị cao hơn nhiều so với mục tiêu. Hệ số bù cho việc các đoạn trong cùng chuyến
+    cùng tắc/cùng thông, ước lượng trên các chuyến đầy đủ của tập train.
+    """
+    print("\nĐang training model phương sai thời gian đi từng đoạn...")
+    residual_train = y_train.to_numpy() - model.predict(X_train)
+    model_var = XGBRegressor(
+        n_estimators=500,
+        learning_rate=0.05,
+        max_depth=7,
+        n_jobs=-1,
+        random_state=42
+    )
+    model_var.fit(X_train, residual_train ** 2)
+
+    variance_scale = 1.0
+    if trips_train is None:
+        print("⚠️ Dữ liệu chưa có cột Date/Vehicle_ID -> coi các đoạn độc lập, không đánh giá được cả tuyến. "
+              "Hãy chạy lại data_train.py!")
+    else:
+        train_sums = complete_trip_sums(trips_train, n_segments, Residual=residual_train,
+                                        Var=np.maximum(model_var.predict(X_train), 0))
+        if len(train_sums) and train_sums['Var'].sum() > 0:
+            variance_scale = float((train_sums['Residual'] ** 2).sum() / train_sums['Var'].sum())
+        print(f"Hệ số tương quan trong chuyến = {variance_scale:.2f} (từ {len(train_sums)} chuyến đầy đủ)")
+
+        # Độ phủ thực tế cả tuyến: tỷ lệ chuyến test có tổng thời gian <= dự báo (nên gần bằng q)
+        test_sums = complete_trip_sums(trips_test, n_segments, Actual=y_test, Mean=model.predict(X_test),
+                                       Var=np.maximum(model_var.predict(X_test), 0))
+        for q in QUANTILES:
+            route_q = test_sums['Mean'] + QUANTILE_Z[q] * np.sqrt(variance_scale * test_sums['Var'])
+            coverage = float(np.mean(test_sums['Actual'] <= route_q)) if len(test_sums) else np.nan
+            print(f"P{q} cả tuyến: độ phủ trên {len(test_sums)} chuyến test = {coverage * 100:.1f}% (mục tiêu {q}%)")
+
+    export_and_verify(model_var, X_test, VARIANCE_EXPORT_FILE, variance_scale=variance_scale)
 
 def train_model_xgboost():
     print("--- HUẤN LUYỆN AI VỚI XGBOOST (STATE-OF-THE-ART) ---")
@@ -25,7 +90,17 @@ def train_model_xgboost():
     X = df[['Hour', 'DayOfWeek', 'Segment_Index']]
     y = df['Duration_Minutes']
     
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    n_segments = df['Segment_Index'].nunique()
+
+    # Có mã chuyến -> chia train/test theo chuyến để tập test còn nguyên chuyến (đánh giá được cả tuyến)
+    if {'Date', 'Vehicle_ID'}.issubset(df.columns):
+        trips = df['Date'].astype(str) + '_' + df['Vehicle_ID'].astype(str)
+        train_idx, test_idx = next(GroupShuffleSplit(n_splits=1, test_size=0.2, random_state=42).split(X, y, trips))
+        X_train, X_test, y_train, y_test = X.iloc[train_idx], X.iloc[test_idx], y.iloc[train_idx], y.iloc[test_idx]
+        trips_train, trips_test = trips.iloc[train_idx], trips.iloc[test_idx]
+    else:
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+        trips_train = trips_test = None
     
     # 2. Khởi tạo & Train XGBoost
     # - n_estimators=500: Tạo 500 cây sửa sai liên tiếp
@@ -57,6 +132,8 @@ def train_model_xgboost():
     # 4. Lưu model
     joblib.dump(model, MODEL_FILE)
     print(f"Đã lưu siêu mô hình vào: {MODEL_FILE}")
+    export_and_verify(model, X_test)
+    train_variance_model(model, X_train, y_train, X_test, y_test, trips_train, trips_test, n_segments)
     
     # --- VISUALIZATION ---
     print("\nĐang vẽ biểu đồ so sánh...")
@@ -5,6 +5,7 @@ from folium.plugins import TimestampedGeoJson
 import random
 import json
 from datetime import datetime
+from gps_archive import open_archive_for
 
 # --- CẤU HÌNH ---
 # 1. Thư mục chứa 30 tuyến
@@ -65,7 +66,8 @@ def create_gps_animation_data(gps_file, mapping_file):
     # 1. Load Mapping (Để biết xe nào thuộc tuyến nào)
     veh_to_route = {}
     if os.path.exists(mapping_file):
-        df_map = pd.read_csv(mapping_file)
+        # Mã xe đọc dạng chuỗi (cả archive lẫn CSV) để tra được cả mã dạng số
+        df_map = pd.read_csv(mapping_file, dtype={'Vehicle_ID': str, 'Predicted_Route_No': str})
         # Tạo dict: {'xe_abc': '01', 'xe_xyz': '152'}
         veh_to_route = pd.Series(df_map.Predicted_Route_No.values, index=df_map.Vehicle_ID).to_dict()
     else:
@@ -74,16 +76,25 @@ def create_gps_animation_data(gps_file, mapping_file):
     # 2. Load GPS
     # Lấy mẫu: Chỉ lấy 10000 dòng đầu hoặc lấy mẫu ngẫu nhiên để tránh trình duyệt bị đơ
     # Nếu máy mạnh có thể bỏ nrows
-    df_gps = pd.read_csv(gps_file) 
-    
-    # Lọc dữ liệu rác
-    df_gps = df_gps.dropna(subset=['lat', 'lng', 'datetime'])
-    
-    # Convert datetime sang format chuẩn ISO 8601 cho Javascript
-    df_gps['datetime'] = pd.to_datetime(df_gps['datetime'])
-    # Chỉ lấy dữ liệu trong khoảng thời gian ngắn (ví dụ 1 tiếng buổi sáng) để demo cho nhẹ
-    # Bạn có thể comment dòng dưới nếu muốn chạy cả ngày
-    df_gps = df_gps[(df_gps['datetime'].dt.hour >= 6) & (df_gps['datetime'].dt.hour < 7)]
+    archive = open_archive_for(gps_file)
+    if archive is not None:
+        # Có archive nhị phân -> chỉ cắt đúng khung giờ của từng xe, không đọc cả ngày
+        day = pd.to_datetime(archive.records['ts'][:1], unit='s').normalize()[0] if len(archive) else None
+        if day is None:
+            return []
+        rows, owners = archive.window(day + pd.Timedelta(hours=6), day + pd.Timedelta(hours=7))
+        df_gps = archive.to_frame(rows, veh_id=owners)
+    else:
+        df_gps = pd.read_csv(gps_file, dtype={'anonymized_vehicle': str})
+        
+        # Lọc dữ liệu rác
+        df_gps = df_gps.dropna(subset=['lat', 'lng', 'datetime'])
+        
+        # Convert datetime sang format chuẩn ISO 8601 cho Javascript
+        df_gps['datetime'] = pd.to_datetime(df_gps['datetime'])
+        # Chỉ lấy dữ liệu trong khoảng thời gian ngắn (ví dụ 1 tiếng buổi sáng) để demo cho nhẹ
+        # Bạn có thể comment dòng dưới nếu muốn chạy cả ngày
+        df_gps = df_gps[(df_gps['datetime'].dt.hour >= 6) & (df_gps['datetime'].dt.hour < 7)]
     
     df_gps['time_str'] = df_gps['datetime'].dt.strftime('%Y-%m-%dT%H:%M:%S')
 